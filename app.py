@@ -1,32 +1,16 @@
 import streamlit as st
-import numpy as np
-import cv2
-from PIL import Image, ExifTags
 import io
-import base64
-import requests
 import plotly.graph_objects as go
 from fpdf import FPDF
 import traceback
-import os
 import json
-from google.cloud import vision  # Google Cloud Vision API
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-# Critical imports with error handling
-try:
-    from deepface import DeepFace
-except ImportError as e:
-    st.error("Failed to import DeepFace. Please check your installation.")
-    st.error(f"Error message: {str(e)}")
-    st.stop()
-
-# Initialize Google Cloud Vision client
-try:
-    vision_client = vision.ImageAnnotatorClient()
-except Exception as e:
-    st.warning("Google Cloud Vision not initialized. Location detection will be limited.")
-    st.session_state.debug_info.append(f"Google Vision error: {str(e)}")
-    vision_client = None
+# Shared analysis helpers; importing core loads DeepFace/TensorFlow once per process
+from core import (ort, load_detector, load_models, analysis_cache_kind, decode_image, content_key, read_cached_result,
+                  write_cached_result, resize_for_analysis, ANALYSIS_BATCH_SIZE, analyze_images, make_thumbnail, REPORT_IMAGE_WIDTH,
+                  get_vision_client, extract_exif_data, google_vision_analysis, upload_to_imgbb)
 
 # Initialize session state
 if 'debug_info' not in st.session_state:
@@ -39,6 +23,20 @@ if 'imgbb_urls' not in st.session_state:
     st.session_state.imgbb_urls = {}
 if 'location_info' not in st.session_state:
     st.session_state.location_info = {}
+if 'decoded_images' not in st.session_state:
+    st.session_state.decoded_images = {}
+if 'thumbnails' not in st.session_state:
+    st.session_state.thumbnails = {}
+if 'charts' not in st.session_state:
+    st.session_state.charts = {}
+if 'uploaded_name_set' not in st.session_state:
+    st.session_state.uploaded_name_set = set()
+if 'report_images' not in st.session_state:
+    st.session_state.report_images = {}
+
+# Initialize Google Cloud Vision client
+if get_vision_client() is None:
+    st.warning("Google Cloud Vision not initialized. Location detection will be limited.")
 
 # Custom CSS for styling
 st.markdown("""
@@ -64,14 +62,34 @@ with st.sidebar:
     st.header("Image History")
     if st.session_state.uploaded_files:
         for file in st.session_state.uploaded_files:
-            st.image(file.getvalue(), width=100, caption=file.name)
+            st.image(st.session_state.thumbnails.get(file.name) or file.getvalue(), width=100, caption=file.name)
         if st.button("Clear Gallery"):
             st.session_state.uploaded_files = []
             st.session_state.analysis_results = {}
             st.session_state.imgbb_urls = {}
             st.session_state.location_info = {}
+            st.session_state.decoded_images = {}
+            st.session_state.thumbnails = {}
+            st.session_state.charts = {}
+            st.session_state.uploaded_name_set = set()
+            st.session_state.report_images = {}
+            st.session_state.file_sig = None
             st.experimental_rerun()
 
+# INT8 attribute models are only available on the ONNX Runtime path
+use_int8 = ort is not None and st.sidebar.checkbox("Fast INT8 attribute models", value=False, help="Run the gender, emotion and race classifiers with INT8 weights. Faster on CPU, with slightly lower precision.")
+
+# Load the face detector and attribute models up front; both are cached per process, so this only
+# takes time on the first run and the first upload doesn't pay for it. A failure here only disables
+# facial analysis; metadata, Vision and reverse image search still work
+with st.spinner("Loading face analysis models..."):
+    try:
+        load_detector()
+        load_models(use_int8)
+    except Exception as e:
+        st.warning("Face analysis models could not be loaded. Facial analysis will be unavailable.")
+        st.session_state.debug_info.append(f"Model loading error: {str(e)}")
+
 # Test Plotly chart to verify rendering
 st.subheader("Test Chart")
 test_fig = go.Figure(data=[go.Pie(labels=['A', 'B'], values=[30, 70])])
@@ -81,99 +99,131 @@ st.plotly_chart(test_fig, use_container_width=True)
 # File uploader
 new_files = st.file_uploader("Upload Images", accept_multiple_files=True, type=['jpg', 'jpeg', 'png'])
 
-# Function to extract EXIF data
-def extract_exif_data(image):
-    try:
-        img = Image.open(image)
-        exif_data = img._getexif()
-        if exif_data:
-            exif = {ExifTags.TAGS.get(k, k): v for k, v in exif_data.items()}
-            gps_info = exif.get('GPSInfo')
-            if gps_info:
-                lat = gps_info.get(2)
-                lon = gps_info.get(4)
-                if lat and lon:
-                    lat = float(lat[0]) + float(lat[1])/60 + float(lat[2])/3600
-                    lon = float(lon[0]) + float(lon[1])/60 + float(lon[2])/3600
-                    if gps_info.get(1) == 'S':
-                        lat = -lat
-                    if gps_info.get(3) == 'W':
-                        lon = -lon
-                    return {"latitude": lat, "longitude": lon, "other": exif}
-        return {"latitude": None, "longitude": None, "other": exif_data}
-    except Exception as e:
-        st.session_state.debug_info.append(f"EXIF extraction error: {str(e)}")
-        return {"latitude": None, "longitude": None, "other": None}
+# Function to return the decoded BGR array for an upload (None if it can't be decoded), kept in session
+# state so reruns skip the decode
+MAX_DECODED_CACHE_BYTES = 50 * 1024 * 1024
+
+def get_decoded_image(file):
+    img = st.session_state.decoded_images.get(file.name)
+    if img is None:
+        img = decode_image(file.getvalue())
+        if img is not None and img.nbytes <= MAX_DECODED_CACHE_BYTES:
+            st.session_state.decoded_images[file.name] = img
+    return img
 
-# Function for Google Cloud Vision analysis
-def google_vision_analysis(img_bytes):
-    if not vision_client:
-        return {"landmarks": [], "objects": [], "labels": []}
+# Function to decode an upload, cache its sidebar thumbnail and return the copy sized for analysis; runs in worker threads
+def preprocess_upload(file):
     try:
-        image = vision.Image(content=img_bytes)
-        # Landmark detection
-        response = vision_client.landmark_detection(image=image)
-        landmarks = [landmark.description for landmark in response.landmark_annotations]
-        # Object detection
-        response = vision_client.object_localization(image=image)
-        objects = [obj.name for obj in response.localized_object_annotations]
-        # Label detection
-        response = vision_client.label_detection(image=image)
-        labels = [label.description for label in response.label_annotations]
-        return {"landmarks": landmarks, "objects": objects, "labels": labels}
+        img = get_decoded_image(file)
+        if img is None:
+            return None
+        st.session_state.thumbnails[file.name] = make_thumbnail(img) or file.getvalue()
+        return resize_for_analysis(img)
     except Exception as e:
-        st.session_state.debug_info.append(f"Google Vision analysis error: {str(e)}")
-        return {"landmarks": [], "objects": [], "labels": []}
+        st.session_state.debug_info.append(f"Preprocessing error for {file.name}: {str(e)}")
+        return None
 
-# Process new uploads
-if new_files:
-    existing_names = [f.name for f in st.session_state.uploaded_files]
+# Process new uploads, but only when the uploader's selection changed; reruns triggered by other widgets skip ingest
+file_sig = tuple((f.name, f.size) for f in new_files) if new_files else ()
+if new_files and st.session_state.get('file_sig') != file_sig:
+    st.session_state.file_sig = file_sig
+    batch_files = []
     for file in new_files:
         if file.type not in ['image/jpeg', 'image/png']:
             st.error(f"Invalid file type for {file.name}. Please upload a jpg or png image.")
             st.session_state.debug_info.append(f"Invalid file type: {file.type} for {file.name}")
             continue
-        if file.name not in existing_names:
+        if file.name not in st.session_state.uploaded_name_set:
             st.session_state.uploaded_files.append(file)
-            img_bytes = file.getvalue()
-            
-            # DeepFace analysis
-            with st.spinner(f"Analyzing facial features for {file.name}..."):
+            st.session_state.uploaded_name_set.add(file.name)
+            batch_files.append(file)
+
+    if batch_files:
+        try:
+            api_key = st.secrets.get("IMGBB_API_KEY", None)
+            if not api_key:
+                st.error("ImgBB API key not set. Reverse image search will be limited.")
+                st.session_state.debug_info.append("ImgBB API key not found in secrets.")
+        except Exception as e:
+            api_key = None
+            st.session_state.debug_info.append(f"ImgBB error: {str(e)}")
+
+        # EXIF parsing, Google Vision and the ImgBB upload are independent and mostly wait on I/O, so they
+        # run in worker threads while the batched DeepFace call runs here; worker threads need the
+        # script run context to reach st.session_state
+        ctx = get_script_run_ctx()
+        keys = {file.name: content_key(file.getvalue()) for file in batch_files}
+        with ThreadPoolExecutor(max_workers=8, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor, \
+                ThreadPoolExecutor(max_workers=4, initializer=add_script_run_ctx, initargs=(None, ctx)) as prep_executor:
+            # Decoding and resizing get their own workers, so they never queue behind the network jobs and
+            # later images are still being prepared while the models run on the earlier ones
+            prep_jobs = {file.name: prep_executor.submit(preprocess_upload, file) for file in batch_files}
+            exif_jobs = [executor.submit(extract_exif_data, file) for file in batch_files]
+            vision_job = executor.submit(google_vision_analysis, [file.getvalue() for file in batch_files], [keys[file.name] for file in batch_files])
+            imgbb_jobs = [executor.submit(upload_to_imgbb, file.name, file.getvalue(), api_key) if api_key else None for file in batch_files]
+
+            # DeepFace analysis, batched across all new uploads
+            with st.spinner(f"Analyzing facial features for {len(batch_files)} image(s)..."):
+                # Only images missing from the on-disk result cache go through the models; the cache bucket follows
+                # the precision the models actually loaded with, not the checkbox
                 try:
-                    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-                    result = DeepFace.analyze(img, actions=['age', 'gender', 'emotion', 'race'], enforce_detection=False)
-                    st.session_state.analysis_results[file.name] = result
-                    st.session_state.debug_info.append(f"DeepFace result for {file.name}: {result}")
+                    cache_kind = analysis_cache_kind(use_int8)
                 except Exception as e:
-                    st.error(f"Error analyzing {file.name}: {str(e)}")
-                    st.session_state.debug_info.append(str(e))
+                    cache_kind = None
+                    st.session_state.debug_info.append(f"Model loading error: {str(e)}")
+                pending = []
+                for file in batch_files:
+                    result = read_cached_result(cache_kind, keys[file.name]) if cache_kind else None
+                    if result is None:
+                        pending.append(file)
+                    else:
+                        st.session_state.analysis_results[file.name] = result
+                for start in range(0, len(pending), ANALYSIS_BATCH_SIZE):
+                    chunk, images = [], []
+                    for file in pending[start:start + ANALYSIS_BATCH_SIZE]:
+                        img = prep_jobs[file.name].result()
+                        if img is None:
+                            st.error(f"Error analyzing {file.name}: the image could not be decoded.")
+                            st.session_state.debug_info.append(f"Image decode failed for {file.name}")
+                            continue
+                        chunk.append(file)
+                        images.append(img)
+                    if not chunk:
+                        continue
+                    try:
+                        results = analyze_images(tuple(keys[file.name] for file in chunk), images, quantized=use_int8)
+                    except Exception as e:
+                        st.error(f"Error analyzing {', '.join(file.name for file in chunk)}: {str(e)}")
+                        st.session_state.debug_info.append(str(e))
+                        continue
+                    for file, result in zip(chunk, results):
+                        st.session_state.analysis_results[file.name] = result
+                        if cache_kind:
+                            write_cached_result(cache_kind, keys[file.name], result)
+                for file in batch_files:
+                    if file.name in st.session_state.analysis_results:
+                        st.session_state.debug_info.append(f"DeepFace result for {file.name}: {st.session_state.analysis_results[file.name]}")
 
-            # EXIF data extraction
-            with st.spinner(f"Extracting metadata for {file.name}..."):
-                exif_data = extract_exif_data(file)
-                st.session_state.location_info[file.name] = exif_data
+            with st.spinner(f"Extracting metadata and detecting locations for {len(batch_files)} image(s)..."):
+                for file, exif_job, vision_results, imgbb_job in zip(batch_files, exif_jobs, vision_job.result(), imgbb_jobs):
+                    st.session_state.location_info[file.name] = exif_job.result()
+                    st.session_state.location_info[file.name].update(vision_results)
+                    img_url = imgbb_job.result() if imgbb_job else None
+                    if img_url:
+                        st.session_state.imgbb_urls[file.name] = img_url
 
-            # Google Cloud Vision analysis
-            with st.spinner(f"Detecting location and objects for {file.name}..."):
-                vision_results = google_vision_analysis(img_bytes)
-                st.session_state.location_info[file.name].update(vision_results)
+# Shared Plotly layout for the per-face probability charts
+CHART_LAYOUT = dict(margin=dict(t=40, b=0, l=0, r=0))
 
-            # ImgBB upload for reverse search
-            try:
-                api_key = st.secrets.get("IMGBB_API_KEY", None)
-                if not api_key:
-                    st.error("ImgBB API key not set. Reverse image search will be limited.")
-                    st.session_state.debug_info.append("ImgBB API key not found in secrets.")
-                else:
-                    url = "https://api.imgbb.com/1/upload"
-                    payload = {"key": api_key, "image": base64.b64encode(img_bytes).decode()}
-                    response = requests.post(url, payload)
-                    if response.status_code == 200:
-                        st.session_state.imgbb_urls[file.name] = response.json()['data']['url']
-                    else:
-                        st.session_state.debug_info.append(f"ImgBB upload failed: {response.text}")
-            except Exception as e:
-                st.session_state.debug_info.append(f"ImgBB error: {str(e)}")
+# Function to build a probability chart once per (file, face, chart) and reuse the figure on later reruns
+def probability_chart(key, kind, probs, title):
+    fig = st.session_state.charts.get(key)
+    if fig is None:
+        labels, values = tuple(probs.keys()), tuple(probs.values())
+        trace = go.Pie(labels=labels, values=values, hole=0.3) if kind == "pie" else go.Bar(x=labels, y=values)
+        fig = go.Figure(data=[trace], layout=CHART_LAYOUT | {"title": title})
+        st.session_state.charts[key] = fig
+    return fig
 
 # Display results
 if st.session_state.uploaded_files:
@@ -200,15 +250,9 @@ if st.session_state.uploaded_files:
                         for j, result in enumerate(results):
                             st.subheader(f"Face {j+1}")
                             st.write(f"Age: {result['age']}")
-                            fig_gender = go.Figure(data=[go.Pie(labels=list(result['gender'].keys()), values=list(result['gender'].values()), hole=0.3)])
-                            fig_gender.update_layout(title="Gender Probability")
-                            st.plotly_chart(fig_gender, use_container_width=True)
-                            fig_emotion = go.Figure(data=[go.Bar(x=list(result['emotion'].keys()), y=list(result['emotion'].values()))])
-                            fig_emotion.update_layout(title="Emotion Probability")
-                            st.plotly_chart(fig_emotion, use_container_width=True)
-                            fig_race = go.Figure(data=[go.Pie(labels=list(result['race'].keys()), values=list(result['race'].values()), hole=0.3)])
-                            fig_race.update_layout(title="Race Probability")
-                            st.plotly_chart(fig_race, use_container_width=True)
+                            st.plotly_chart(probability_chart((file.name, j, "gender"), "pie", result['gender'], "Gender Probability"), use_container_width=True)
+                            st.plotly_chart(probability_chart((file.name, j, "emotion"), "bar", result['emotion'], "Emotion Probability"), use_container_width=True)
+                            st.plotly_chart(probability_chart((file.name, j, "race"), "pie", result['race'], "Race Probability"), use_container_width=True)
                     else:
                         st.warning(f"No faces detected in {file.name}.")
 
@@ -229,40 +273,57 @@ if st.session_state.uploaded_files:
                 if location_info.get("other"):
                     st.write(f"Other Metadata: {json.dumps(location_info['other'], indent=2)}")
 
+# Function to encode the report-sized JPEG for an upload (the original bytes if encoding fails), or None if it can't be decoded
+def report_image(file):
+    img = get_decoded_image(file)
+    if img is None:
+        return None
+    return make_thumbnail(img, REPORT_IMAGE_WIDTH) or file.getvalue()
+
 # PDF report generation
 def generate_pdf():
+    # Encode the report images that aren't cached yet in worker threads; decoding and JPEG encoding release the GIL
+    missing = [file for file in st.session_state.uploaded_files if file.name not in st.session_state.report_images]
+    if missing:
+        ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(max_workers=8, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+            encoded = executor.map(report_image, missing)
+            st.session_state.report_images.update(zip([file.name for file in missing], encoded))
+
     pdf = FPDF()
     for file in st.session_state.uploaded_files:
         pdf.add_page()
-        img = Image.open(file)
-        img_path = f"temp_{file.name}"
-        img.save(img_path)
-        pdf.image(img_path, x=10, y=10, w=90)
-        os.remove(img_path)
+        if st.session_state.report_images[file.name] is not None:
+            pdf.image(io.BytesIO(st.session_state.report_images[file.name]), x=10, y=10, w=90)
         pdf.set_xy(10, 110)
-        pdf.set_font("Arial", size=12)
-        
+        pdf.set_font("Helvetica", size=12)
+        lines = []
+
         # Facial analysis
         if file.name in st.session_state.analysis_results:
             results = st.session_state.analysis_results[file.name]
             if isinstance(results, list) and len(results) > 0:
                 for j, result in enumerate(results):
-                    pdf.cell(0, 10, f"Face {j+1}: Age {result['age']}, Gender {result['dominant_gender']}, Emotion {result['dominant_emotion']}, Race {result['dominant_race']}", ln=True)
+                    lines.append(f"Face {j+1}: Age {result['age']}, Gender {result['dominant_gender']}, Emotion {result['dominant_emotion']}, Race {result['dominant_race']}")
             else:
-                pdf.cell(0, 10, f"No faces detected in {file.name}", ln=True)
-        
+                lines.append(f"No faces detected in {file.name}")
+
         # Location and metadata
         location_info = st.session_state.location_info.get(file.name, {})
         if location_info.get("latitude") and location_info.get("longitude"):
-            pdf.cell(0, 10, f"GPS: ({location_info['latitude']}, {location_info['longitude']})", ln=True)
+            lines.append(f"GPS: ({location_info['latitude']}, {location_info['longitude']})")
         if location_info.get("landmarks"):
-            pdf.cell(0, 10, f"Landmarks: {', '.join(location_info['landmarks'])}", ln=True)
+            lines.append(f"Landmarks: {', '.join(location_info['landmarks'])}")
         if location_info.get("objects"):
-            pdf.cell(0, 10, f"Objects: {', '.join(location_info['objects'])}", ln=True)
+            lines.append(f"Objects: {', '.join(location_info['objects'])}")
         if location_info.get("labels"):
-            pdf.cell(0, 10, f"Labels: {', '.join(location_info['labels'])}", ln=True)
-    
-    return pdf.output(dest='S').encode('latin1')
+            lines.append(f"Labels: {', '.join(location_info['labels'])}")
+
+        # Emit the whole page body in a single layout pass
+        if lines:
+            pdf.multi_cell(0, 10, "\n".join(lines))
+
+    return bytes(pdf.output())
 
 # Download report button
 if st.session_state.uploaded_files and st.button("Download Full Report"):
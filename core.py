@@ -0,0 +1,510 @@
+import streamlit as st
+import io
+import numpy as np
+import cv2
+from PIL import Image, ExifTags
+from PIL.TiffImagePlugin import IFDRational
+import requests
+from requests.adapters import HTTPAdapter
+import os
+import json
+import hashlib
+import tempfile
+from importlib import metadata
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import vision  # Google Cloud Vision API
+
+# Pin TensorFlow to the first GPU (if any) and let it allocate memory on demand; must be set before TF is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "0")
+os.environ.setdefault("TF_FORCE_GPU_ALLOW_GROWTH", "true")
+# Stream-ordered CUDA allocator instead of TF's BFC allocator, and oneDNN kernels for CPU inference
+os.environ.setdefault("TF_GPU_ALLOCATOR", "cuda_malloc_async")
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+
+# Critical imports with error handling
+try:
+    import tensorflow as tf
+    from deepface import DeepFace
+    from deepface.commons import functions
+    from deepface.detectors import FaceDetector
+    from deepface.extendedmodels import Gender, Race, Emotion
+except ImportError as e:
+    st.error("Failed to import DeepFace. Please check your installation.")
+    st.error(f"Error message: {str(e)}")
+    st.stop()
+
+# Device the Keras models run on when the ONNX path is unavailable
+INFERENCE_DEVICE = "/GPU:0" if tf.config.list_physical_devices("GPU") else "/CPU:0"
+
+# Optional ONNX Runtime acceleration for the attribute models
+try:
+    import onnx
+    import onnxruntime as ort
+    import tf2onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:
+    ort = None
+
+# Thin adapter exposing the Keras predict() interface on top of an ONNX Runtime session
+class OnnxModel:
+    def __init__(self, session, int8=False):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.on_gpu = session.get_providers()[0] != "CPUExecutionProvider"
+        self.int8 = int8
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        batch = batch.astype(np.float32, copy=False)
+        step = batch_size or len(batch)
+        return np.concatenate([self.session.run(None, {self.input_name: batch[i:i + step]})[0] for i in range(0, len(batch), step)])
+
+# Execution providers in order of preference: TensorRT (FP16 engines, cached on disk so they are only
+# built once per model and GPU), then CUDA, then CPU
+TRT_ENGINE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "deepface_trt_engines")
+
+ONNX_PROVIDERS = (
+    ("TensorrtExecutionProvider", {"trt_fp16_enable": True, "trt_engine_cache_enable": True, "trt_engine_cache_path": TRT_ENGINE_CACHE_DIR}),
+    ("CUDAExecutionProvider", {}),
+    ("CPUExecutionProvider", {}),
+)
+
+# Classification heads that may run with INT8 weights; Age stays in float because its output is an expected value
+QUANTIZABLE_MODELS = ("Gender", "Emotion", "Race")
+
+# Function to describe a dynamic-batch TensorRT optimization profile (1 to ANALYSIS_BATCH_SIZE rows), so one
+# engine serves every chunk size instead of a new engine being built for each batch shape seen
+def trt_profile(model_proto):
+    graph_input = model_proto.graph.input[0]
+    dims = "x".join(str(d.dim_value) for d in graph_input.type.tensor_type.shape.dim[1:])
+    return {
+        "trt_profile_min_shapes": f"{graph_input.name}:1x{dims}",
+        "trt_profile_opt_shapes": f"{graph_input.name}:{ANALYSIS_BATCH_SIZE}x{dims}",
+        "trt_profile_max_shapes": f"{graph_input.name}:{ANALYSIS_BATCH_SIZE}x{dims}",
+    }
+
+# Exported ONNX models are kept on disk, so after the first run the app opens them directly and skips
+# building the Keras models and the tf2onnx conversion. File names carry the DeepFace version, the opset and
+# the export precision, so an upgrade or a change in how models are exported never reuses stale files
+ONNX_MODEL_DIR = os.path.join(".cache", "onnx")
+ONNX_OPSET = 17
+
+try:
+    DEEPFACE_VERSION = metadata.version("deepface")
+except metadata.PackageNotFoundError:
+    DEEPFACE_VERSION = "unknown"
+
+ONNX_EXPORT_TAG = f"deepface{DEEPFACE_VERSION}_opset{ONNX_OPSET}_fp32"
+
+def onnx_model_path(name, quantized=False):
+    suffix = ".int8.onnx" if quantized and name in QUANTIZABLE_MODELS else ".onnx"
+    return os.path.join(ONNX_MODEL_DIR, f"{name.lower()}_{ONNX_EXPORT_TAG}{suffix}")
+
+# Function to delete a model's exported files, so the next load exports it again instead of reopening them
+def discard_onnx(name, quantized=False):
+    for path in {onnx_model_path(name), onnx_model_path(name, quantized)}:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Function to export a built Keras model to ONNX (and its INT8 variant if requested) unless already on disk;
+# files are written under a temporary name first so an interrupted export never leaves a truncated model,
+# and exports of this model from other versions are removed
+def export_onnx(name, model, quantized=False):
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    for entry in os.scandir(ONNX_MODEL_DIR):
+        if entry.name.startswith(f"{name.lower()}_") and ONNX_EXPORT_TAG not in entry.name:
+            os.remove(entry.path)
+    float_path = onnx_model_path(name)
+    if not os.path.exists(float_path):
+        tf2onnx.convert.from_keras(model, opset=ONNX_OPSET, output_path=float_path + ".tmp")
+        os.replace(float_path + ".tmp", float_path)
+    onnx_path = onnx_model_path(name, quantized)
+    if not os.path.exists(onnx_path):
+        quantize_dynamic(float_path, onnx_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(onnx_path + ".tmp", onnx_path)
+    return onnx_path
+
+# Function to open an exported model with all graph optimizations enabled
+def open_onnx(onnx_path):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    providers = [(provider, opts | trt_profile(onnx.load(onnx_path)) if provider == "TensorrtExecutionProvider" else opts)
+                 for provider, opts in ONNX_PROVIDERS if provider in ort.get_available_providers()]
+    return OnnxModel(ort.InferenceSession(onnx_path, sess_options=options, providers=providers), onnx_path.endswith(".int8.onnx"))
+
+# Face detector backend, built once per process; DeepFace keeps built detectors in a module-level dict that
+# extract_faces reads, so loading it here takes the cascade load off the first upload
+DETECTOR_BACKEND = "opencv"
+
+@st.cache_resource(show_spinner=False)
+def load_detector(backend=DETECTOR_BACKEND):
+    return FaceDetector.build_model(backend)
+
+# Function to run a model once on a dummy batch, so graph tracing and TensorRT engine builds happen
+# while the models load instead of on the first upload; raises if the model cannot run
+def warm_up(model):
+    shape = model.session.get_inputs()[0].shape[1:] if isinstance(model, OnnxModel) else model.input_shape[1:]
+    model.predict(np.zeros((1, *shape), dtype=np.float32), verbose=0)
+    return model
+
+# Facial attribute models, built once per process (and per precision) and shared across reruns. Saved ONNX
+# exports are opened directly; any model without one, or whose ONNX session fails to open or warm up, is
+# rebuilt from Keras (and exported again when ONNX Runtime is available)
+MODEL_NAMES = ("Age", "Gender", "Emotion", "Race")
+
+@st.cache_resource(show_spinner=False)
+def load_models(quantized=False):
+    models = {}
+    if ort is not None:
+        for name in MODEL_NAMES:
+            if os.path.exists(onnx_model_path(name, quantized)):
+                try:
+                    models[name] = warm_up(open_onnx(onnx_model_path(name, quantized)))
+                except Exception as e:
+                    st.session_state.debug_info.append(f"Loading saved ONNX model failed for {name}, rebuilding: {str(e)}")
+                    discard_onnx(name, quantized)
+    missing = [name for name in MODEL_NAMES if name not in models]
+    if not missing:
+        return models
+    # Keras-only GPU inference runs under a mixed_float16 policy with XLA fusion. Both settings are process-wide,
+    # so with ONNX Runtime available the models are built and exported in FP32 (clean initializers for INT8
+    # quantization, portable to CPU hosts) and the TensorRT provider supplies FP16 itself
+    if ort is None and INFERENCE_DEVICE == "/GPU:0":
+        tf.keras.mixed_precision.set_global_policy("mixed_float16")
+        tf.config.optimizer.set_jit(True)
+    with tf.device(INFERENCE_DEVICE):
+        keras_models = {name: DeepFace.build_model(name) for name in missing}
+    for name, model in keras_models.items():
+        if ort is not None:
+            try:
+                models[name] = warm_up(open_onnx(export_onnx(name, model, quantized)))
+                continue
+            except Exception as e:
+                st.session_state.debug_info.append(f"ONNX export failed for {name}, using Keras: {str(e)}")
+                discard_onnx(name, quantized)
+        try:
+            models[name] = warm_up(model)
+        except Exception as e:
+            # Nothing left to fall back to; keep the model and let analysis report the error
+            st.session_state.debug_info.append(f"Warm-up failed for {name}: {str(e)}")
+            models[name] = model
+    return models
+
+# Optional libjpeg-turbo decoder for JPEG uploads
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:
+    TurboJPEG = None
+
+@st.cache_resource(show_spinner=False)
+def load_jpeg_decoder():
+    try:
+        return TurboJPEG() if TurboJPEG else None
+    except Exception:
+        # Python bindings installed but the libturbojpeg shared library is missing
+        return None
+
+# Function to read the EXIF Orientation tag of an image without decoding its pixels (1 = upright)
+def exif_orientation(img_bytes):
+    try:
+        return Image.open(io.BytesIO(img_bytes)).getexif().get(ExifTags.Base.Orientation, 1)
+    except Exception:
+        return 1
+
+# Function to decode uploaded image bytes into an upright BGR ndarray in memory (None if undecodable)
+def decode_image(img_bytes):
+    jpeg = load_jpeg_decoder()
+    # TurboJPEG ignores the EXIF Orientation tag, so rotated photos are left to OpenCV, which applies it
+    if jpeg and img_bytes[:2] == b"\xff\xd8" and exif_orientation(img_bytes) == 1:
+        try:
+            return jpeg.decode(img_bytes, pixel_format=TJPF_BGR)
+        except Exception:
+            # e.g. CMYK or damaged JPEGs; fall back to OpenCV
+            pass
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+# On-disk cache of per-image results (DeepFace, Vision), keyed by a hash of the uploaded bytes and bounded to
+# RESULT_CACHE_MAX_ENTRIES files; reads refresh a file's mtime, so the oldest mtimes are the least recently used
+RESULT_CACHE_DIR = ".cache"
+RESULT_CACHE_MAX_ENTRIES = 2000
+
+def content_key(img_bytes):
+    return hashlib.sha1(img_bytes).hexdigest()
+
+def read_cached_result(kind, key):
+    path = os.path.join(RESULT_CACHE_DIR, f"{kind}_{key}.json")
+    try:
+        with open(path) as f:
+            result = json.load(f)
+        os.utime(path)
+        return result
+    except (OSError, ValueError):
+        return None
+
+def write_cached_result(kind, key, result):
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(RESULT_CACHE_DIR, f"{kind}_{key}.json"), "w") as f:
+            json.dump(result, f, default=float)
+        evict_cached_results()
+    except OSError as e:
+        st.session_state.debug_info.append(f"Result cache write error: {str(e)}")
+
+# Function to delete the least recently used results once the cache holds more than RESULT_CACHE_MAX_ENTRIES
+def evict_cached_results():
+    entries = [entry for entry in os.scandir(RESULT_CACHE_DIR) if entry.is_file() and entry.name.endswith(".json")]
+    if len(entries) <= RESULT_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - RESULT_CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            # Already removed by a concurrent writer
+            pass
+
+# Function to downscale large images before face detection (the models work on small face crops)
+MAX_ANALYSIS_SIDE = 640
+
+def resize_for_analysis(img, max_side=MAX_ANALYSIS_SIDE):
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+ANALYSIS_ACTIONS = ("age", "gender", "emotion", "race")
+ANALYSIS_BATCH_SIZE = 16
+
+# BT.601 luma weights in BGR order, the same conversion as cv2.COLOR_BGR2GRAY
+GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+# Function to build the (N, 48, 48, 1) grayscale emotion-model input for a whole (N, 224, 224, 3) face batch:
+# one matmul does the color conversion, and cv2.resize handles up to 128 faces per call by treating them as channels
+def emotion_inputs(batch):
+    gray = np.ascontiguousarray((batch @ GRAY_WEIGHTS).transpose(1, 2, 0))
+    resized = [cv2.resize(gray[..., i:i + 128], (48, 48)).reshape(48, 48, -1) for i in range(0, gray.shape[-1], 128)]
+    return np.concatenate(resized, axis=-1).transpose(2, 0, 1)[..., np.newaxis]
+
+def run_model(model, inputs):
+    if isinstance(model, OnnxModel):
+        return model.predict(inputs, batch_size=ANALYSIS_BATCH_SIZE)
+    with tf.device(INFERENCE_DEVICE):
+        return model.predict(inputs, batch_size=ANALYSIS_BATCH_SIZE, verbose=0)
+
+# Function to analyze several images at once: faces are detected per image, then every
+# attribute model runs a single forward pass over the stacked crops of all images
+def analyze_faces(images, actions=ANALYSIS_ACTIONS, quantized=False):
+    models = load_models(quantized)
+    load_detector()
+    faces, regions, owners = [], [], []
+    for idx, img in enumerate(images):
+        face_objs = functions.extract_faces(img=img, target_size=(224, 224), detector_backend=DETECTOR_BACKEND, grayscale=False, enforce_detection=False, align=True)
+        for face, region, _ in face_objs:
+            if face.shape[0] > 0 and face.shape[1] > 0:
+                faces.append(face)
+                regions.append(region)
+                owners.append(idx)
+
+    results = [[] for _ in images]
+    if not faces:
+        return results
+
+    batch = np.concatenate(faces)
+    jobs = {}
+    if "age" in actions:
+        jobs["age"] = (models["Age"], batch)
+    if "gender" in actions:
+        jobs["gender"] = (models["Gender"], batch)
+    if "race" in actions:
+        jobs["race"] = (models["Race"], batch)
+    if "emotion" in actions:
+        jobs["emotion"] = (models["Emotion"], emotion_inputs(batch))
+
+    # ONNX Runtime sessions are thread-safe and release the GIL, so on a GPU the independent heads run concurrently;
+    # on CPU each session already uses every core, and Keras models are not safe to share across threads, so
+    # those run one after another
+    if len(jobs) > 1 and all(isinstance(model, OnnxModel) and model.on_gpu for model, _ in jobs.values()):
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {action: executor.submit(run_model, model, inputs) for action, (model, inputs) in jobs.items()}
+            predictions = {action: future.result() for action, future in futures.items()}
+    else:
+        predictions = {action: run_model(model, inputs) for action, (model, inputs) in jobs.items()}
+    if "age" in predictions:
+        predictions["age"] = predictions["age"].astype(np.float32) @ np.arange(101)
+
+    # Post-process each row the same way DeepFace.analyze does
+    for row, (idx, region) in enumerate(zip(owners, regions)):
+        obj = {}
+        if "emotion" in predictions:
+            emotion = predictions["emotion"][row]
+            obj["emotion"] = {label: float(100 * p / emotion.sum()) for label, p in zip(Emotion.labels, emotion)}
+            obj["dominant_emotion"] = Emotion.labels[int(np.argmax(emotion))]
+        if "age" in predictions:
+            obj["age"] = int(predictions["age"][row])
+        if "gender" in predictions:
+            gender = predictions["gender"][row]
+            obj["gender"] = {label: float(100 * p) for label, p in zip(Gender.labels, gender)}
+            obj["dominant_gender"] = Gender.labels[int(np.argmax(gender))]
+        if "race" in predictions:
+            race = predictions["race"][row]
+            obj["race"] = {label: float(100 * p / race.sum()) for label, p in zip(Race.labels, race)}
+            obj["dominant_race"] = Race.labels[int(np.argmax(race))]
+        obj["region"] = region
+        results[idx].append(obj)
+    return results
+
+# Function to name the result-cache bucket after the precision the loaded models actually run at: "analysis_int8"
+# only when every quantizable head is an INT8 ONNX session, "analysis" when none is, and None (don't cache)
+# for a partial fallback, so Keras or FP32 results are never served as INT8 ones and vice versa
+def analysis_cache_kind(quantized=False):
+    models = load_models(quantized)
+    int8_heads = [isinstance(models[name], OnnxModel) and models[name].int8 for name in QUANTIZABLE_MODELS]
+    if all(int8_heads):
+        return "analysis_int8"
+    if not any(int8_heads):
+        return "analysis"
+    return None
+
+# Batched facial analysis memoized on the content keys of the uploads, so identical uploads are only analyzed once;
+# the decoded arrays themselves are excluded from hashing (leading underscore)
+@st.cache_data(show_spinner=False, max_entries=256)
+def analyze_images(keys, _images, actions=ANALYSIS_ACTIONS, quantized=False):
+    return analyze_faces(list(_images), actions, quantized)
+
+# Function to encode a downscaled JPEG once (None if encoding fails): 100px thumbnails for the sidebar, and report images sized
+# for the 90mm slot in the PDF (~360px) instead of embedding full-resolution masters
+THUMBNAIL_WIDTH = 100
+REPORT_IMAGE_WIDTH = 360
+
+def make_thumbnail(img, width=THUMBNAIL_WIDTH, quality=75):
+    h, w = img.shape[:2]
+    if w > width:
+        img = cv2.resize(img, (width, max(1, int(width * h / w))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+# Google Cloud Vision client, created once per process
+@st.cache_resource(show_spinner=False)
+def get_vision_client():
+    try:
+        return vision.ImageAnnotatorClient()
+    except Exception as e:
+        st.session_state.debug_info.append(f"Google Vision error: {str(e)}")
+        return None
+
+# Weights converting (degrees, minutes, seconds) to decimal degrees
+DMS_WEIGHTS = np.array([1.0, 1 / 60, 1 / 3600])
+
+# Function to turn an EXIF value into something json.dumps can render: rationals become floats, binary blobs
+# (MakerNote, UserComment, ...) are summarized by size, and nested tuples/dicts are converted recursively
+def exif_value(value):
+    if isinstance(value, IFDRational):
+        return float(value)
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, (tuple, list)):
+        return [exif_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: exif_value(v) for k, v in value.items()}
+    return value
+
+# Function to extract EXIF data
+def extract_exif_data(image):
+    try:
+        exif_data = Image.open(image).getexif()
+        if not exif_data:
+            return {"latitude": None, "longitude": None, "other": None}
+        # Read the GPS IFD directly by tag id instead of mapping every tag to its name first
+        gps_info = exif_data.get_ifd(ExifTags.IFD.GPSInfo)
+        # getexif() only holds IFD0; merge in the Exif sub-IFD (DateTimeOriginal, exposure, ...) and show the
+        # GPS IFD itself instead of the raw pointer offsets, as the old _getexif() did
+        other = {ExifTags.TAGS.get(k, k): exif_value(v) for k, v in exif_data.items() if k not in (ExifTags.Base.ExifOffset, ExifTags.Base.GPSInfo)}
+        other.update({ExifTags.TAGS.get(k, k): exif_value(v) for k, v in exif_data.get_ifd(ExifTags.IFD.Exif).items()})
+        if gps_info:
+            other['GPSInfo'] = exif_value(gps_info)
+        lat = gps_info.get(2)
+        lon = gps_info.get(4)
+        if lat and lon:
+            lat = float(np.array(lat, dtype=float) @ DMS_WEIGHTS)
+            lon = float(np.array(lon, dtype=float) @ DMS_WEIGHTS)
+            if gps_info.get(1) == 'S':
+                lat = -lat
+            if gps_info.get(3) == 'W':
+                lon = -lon
+            return {"latitude": lat, "longitude": lon, "other": other}
+        return {"latitude": None, "longitude": None, "other": other}
+    except Exception as e:
+        st.session_state.debug_info.append(f"EXIF extraction error: {str(e)}")
+        return {"latitude": None, "longitude": None, "other": None}
+
+# Google Cloud Vision features requested for every image, the API's per-request image limit, and a payload budget
+# kept under its ~10 MB per-request size limit
+VISION_FEATURES = [
+    vision.Feature(type_=vision.Feature.Type.LANDMARK_DETECTION),
+    vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION),
+    vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION),
+]
+VISION_BATCH_SIZE = 16
+VISION_MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+# Function to split image indices into request batches capped by both image count and total payload size;
+# an image larger than the budget on its own is sent alone
+def vision_batches(indices, images_bytes):
+    batches, batch, size = [], [], 0
+    for i in indices:
+        if batch and (len(batch) == VISION_BATCH_SIZE or size + len(images_bytes[i]) > VISION_MAX_REQUEST_BYTES):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(i)
+        size += len(images_bytes[i])
+    if batch:
+        batches.append(batch)
+    return batches
+
+# Function for Google Cloud Vision analysis, batching all images and features into as few round trips as possible;
+# images already analyzed (same content key) are served from the on-disk result cache
+def google_vision_analysis(images_bytes, keys):
+    results = [read_cached_result("vision", key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    vision_client = get_vision_client()
+    if vision_client and missing:
+        for chunk in vision_batches(missing, images_bytes):
+            try:
+                annotate_requests = [vision.AnnotateImageRequest(image=vision.Image(content=images_bytes[i]), features=VISION_FEATURES) for i in chunk]
+                response = vision_client.batch_annotate_images(requests=annotate_requests)
+                for i, image_response in zip(chunk, response.responses):
+                    results[i] = {
+                        "landmarks": [landmark.description for landmark in image_response.landmark_annotations],
+                        "objects": [obj.name for obj in image_response.localized_object_annotations],
+                        "labels": [label.description for label in image_response.label_annotations],
+                    }
+                    if image_response.error.message:
+                        st.session_state.debug_info.append(f"Google Vision analysis error: {image_response.error.message}")
+                    else:
+                        write_cached_result("vision", keys[i], results[i])
+            except Exception as e:
+                st.session_state.debug_info.append(f"Google Vision analysis error: {str(e)}")
+    # Images without a response (client unavailable or failed batch) get empty results
+    return [result or {"landmarks": [], "objects": [], "labels": []} for result in results]
+
+# Shared HTTP session so outbound uploads reuse pooled TCP/TLS connections across files and reruns
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+    return session
+
+# Function to upload an image to ImgBB so it can be used for reverse image search
+def upload_to_imgbb(file_name, img_bytes, api_key):
+    try:
+        url = "https://api.imgbb.com/1/upload"
+        # Send the raw bytes as a multipart file rather than a base64 form field (4/3 larger)
+        response = get_http_session().post(url, data={"key": api_key}, files={"image": (file_name, img_bytes)}, timeout=15)
+        if response.status_code == 200:
+            return response.json()['data']['url']
+        st.session_state.debug_info.append(f"ImgBB upload failed: {response.text}")
+    except Exception as e:
+        st.session_state.debug_info.append(f"ImgBB error: {str(e)}")
+    return None